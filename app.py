@@ -1,15 +1,33 @@
 import os
+import copy
 import json
+import functools
+import io
+import re
 import uuid
+import shutil
 import subprocess
 import sys
+import tempfile
+import threading
 import logging
+from collections import OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime
 from flask import Flask, render_template, request, send_file, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from yt_dlp import YoutubeDL
-from threading import Thread
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock, local
+from urllib.parse import urlparse
+
+# orjson is optional; it speeds up jsonify responses when installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Monkey patch for yt-dlp compatibility issue
 try:
@@ -17,28 +35,40 @@ try:
 except ImportError:
     pass
 
-# Suppress BrokenPipeError
-def ignore_broken_pipe(func):
-    def wrapper(*args, **kwargs):
-        try:
-            return func(*args, **kwargs)
-        except BrokenPipeError:
-            pass
-    return wrapper
-
 # Suppress warnings from werkzeug about broken pipe
 logging.getLogger('werkzeug').setLevel(logging.ERROR)
 
+
+class ORJSONProvider(DefaultJSONProvider):
+    """JSON provider that serializes responses with orjson
+
+    Datetimes are passed through to Flask's default handler and keys are sorted
+    per sort_keys, so output matches DefaultJSONProvider.
+    """
+
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+
 app = Flask(__name__)
 CORS(app)
+if orjson is not None:
+    app.json = ORJSONProvider(app)
 
 # Configuration
 UPLOAD_FOLDER = 'uploads'
 OUTPUT_FOLDER = 'outputs'
-DOWNLOADS_DIR = Path("downloads")
+DOWNLOADS_DIR = Path("downloads").resolve()
 TEMP_DIR = Path("temp")
 ALLOWED_EXTENSIONS = {'mp3', 'wav', 'ogg', 'm4a'}
 MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+# Characters stripped from video titles when building download filenames
+_TITLE_RE = re.compile(r'[^\w \-]+')
 
 # Create folders if they don't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -46,18 +76,228 @@ os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 DOWNLOADS_DIR.mkdir(exist_ok=True)
 TEMP_DIR.mkdir(exist_ok=True)
 
+# Resolved once so per-request path checks don't re-resolve the folders
+UPLOAD_DIR = Path(UPLOAD_FOLDER).resolve()
+OUTPUT_DIR = Path(OUTPUT_FOLDER).resolve()
+
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
 
-# Store download status for YouTube downloads
-downloads_status = {}
+# Store download status for YouTube downloads, oldest first
+DOWNLOADS_STATUS_LIMIT = 1000
+downloads_status = OrderedDict()
+downloads_status_lock = Lock()
+
+# Bounded worker pool for YouTube downloads; extra requests wait in the executor's queue
+DOWNLOAD_POOL = ThreadPoolExecutor(max_workers=int(os.environ.get("YT_WORKERS", 4)))
+
+
+def _cancel_pending_downloads():
+    """Drop queued downloads at exit so shutdown only waits for ones already running"""
+    DOWNLOAD_POOL.shutdown(wait=False, cancel_futures=True)
+
+
+# concurrent.futures joins its workers from a threading atexit hook after draining the
+# queue; hooks run in reverse order, so registering here cancels the queue first
+if hasattr(threading, '_register_atexit'):
+    threading._register_atexit(_cancel_pending_downloads)
+
+# Per-host download cap so bursts to one site don't trigger throttling.
+# Maps host key -> [semaphore, downloads using it]; entries are dropped when unused,
+# so the table only holds hosts with downloads in flight.
+MAX_DOWNLOADS_PER_HOST = 4
+HOST_SEMAPHORES = {}
+host_semaphores_lock = Lock()
+
+# Hostnames that are served by the same backend and share one download cap
+_HOST_ALIASES = {
+    "youtu.be": "youtube.com",
+    "youtube-nocookie.com": "youtube.com",
+}
+
+
+def download_host_key(url):
+    """Normalize a URL's host so aliases of one site share a download cap"""
+    host = (urlparse(url).hostname or "").rstrip(".")
+    for prefix in ("www.", "m.", "music."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+    return _HOST_ALIASES.get(host, host)
+
+
+@contextmanager
+def host_download_slot(url):
+    """Hold one of the URL host's download slots for the duration of the block"""
+    host = download_host_key(url)
+    with host_semaphores_lock:
+        entry = HOST_SEMAPHORES.get(host)
+        if entry is None:
+            entry = HOST_SEMAPHORES[host] = [BoundedSemaphore(MAX_DOWNLOADS_PER_HOST), 0]
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with host_semaphores_lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del HOST_SEMAPHORES[host]
+
+
+def set_download_status(download_id, status):
+    """Record a download's status and evict old finished entries past the limit"""
+    with downloads_status_lock:
+        downloads_status[download_id] = status
+        downloads_status.move_to_end(download_id)
+        _trim_downloads_status()
+
+
+def _trim_downloads_status():
+    """Drop the oldest completed/errored downloads until under the limit"""
+    excess = len(downloads_status) - DOWNLOADS_STATUS_LIMIT
+    if excess <= 0:
+        return
+    # Walk from the oldest entry and stop once enough finished downloads are found
+    finished = []
+    for download_id, status in downloads_status.items():
+        if status.get("status") in ("completed", "error"):
+            finished.append(download_id)
+            if len(finished) == excess:
+                break
+    for download_id in finished:
+        del downloads_status[download_id]
+
+
+def resolve_in(directory, filename):
+    """Resolve filename inside a resolved directory; returns None if it escapes the directory"""
+    path = (directory / filename).resolve()
+    if path.parent != directory:
+        return None
+    return path
 
 
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return os.path.splitext(filename)[1][1:].lower() in ALLOWED_EXTENSIONS
+
+
+def copy_upload_stream(src, dst):
+    """Copy an upload stream into dst, in-kernel when Werkzeug spooled it to a real file"""
+    src_fd = None
+    # Only spools Werkzeug has already rolled over to disk; fileno() would force an
+    # in-memory spool onto disk, and any other stream type takes the copyfileobj path
+    if (sys.platform.startswith('linux') and isinstance(src, tempfile.SpooledTemporaryFile)
+            and getattr(src, '_rolled', False)):
+        try:
+            src_fd = src.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            pass
+
+    if src_fd is None:
+        shutil.copyfileobj(src, dst, length=UPLOAD_CHUNK_SIZE)
+        return
+
+    offset = src.tell()
+    while True:
+        sent = os.sendfile(dst.fileno(), src_fd, offset, UPLOAD_CHUNK_SIZE)
+        if sent == 0:
+            break
+        offset += sent
+
+
+def save_upload(file, dest_path):
+    """Stream an uploaded file to disk in large chunks"""
+    with open(dest_path, 'wb', buffering=0) as dst:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(dst.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        copy_upload_stream(file.stream, dst)
+
+
+def save_upload_tmpfile(file):
+    """Stream a short-lived upload to disk; returns (path, fd) where fd is set for anonymous files
+
+    On Linux the upload goes to an O_TMPFILE in UPLOAD_FOLDER, which has no directory
+    entry and is reclaimed when the fd is closed; ffmpeg reads it via /proc/self/fd/N.
+    Elsewhere it falls back to a named file.
+    """
+    if hasattr(os, 'O_TMPFILE') and os.path.isdir('/proc/self/fd'):
+        try:
+            fd = os.open(UPLOAD_FOLDER, os.O_TMPFILE | os.O_RDWR, 0o600)
+        except OSError:
+            # Filesystem doesn't support O_TMPFILE
+            fd = None
+        if fd is not None:
+            try:
+                with os.fdopen(fd, 'wb', buffering=0, closefd=False) as dst:
+                    copy_upload_stream(file.stream, dst)
+            except BaseException:
+                os.close(fd)
+                raise
+            return f"/proc/self/fd/{fd}", fd
+
+    temp_path = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4()}_{file.filename}")
+    save_upload(file, temp_path)
+    return temp_path, None
+
+
+def release_temp_file(path, fd):
+    """Close an anonymous temp file, or delete a named one"""
+    try:
+        if fd is not None:
+            os.close(fd)
+        else:
+            os.remove(path)
+    except OSError:
+        pass
+
+
+# Probed durations keyed by (path, mtime, size) so rewritten files are re-probed
+DURATION_CACHE_SIZE = 1024
+duration_cache = OrderedDict()
+duration_cache_lock = Lock()
 
 
 def get_audio_duration(file_path):
+    """Get audio file duration in seconds, caching FFprobe results"""
+    try:
+        st = os.stat(file_path)
+    except OSError as e:
+        app.logger.warning("Error getting duration: %s", e)
+        return None
+
+    key = (os.path.abspath(file_path), st.st_mtime_ns, st.st_size)
+    with duration_cache_lock:
+        if key in duration_cache:
+            duration_cache.move_to_end(key)
+            return duration_cache[key]
+
+    duration = probe_audio_duration(file_path)
+    if duration is not None:
+        with duration_cache_lock:
+            duration_cache[key] = duration
+            while len(duration_cache) > DURATION_CACHE_SIZE:
+                duration_cache.popitem(last=False)
+    return duration
+
+
+def run_ffprobe(cmd, pass_fds=()):
+    """Run an ffprobe command, discarding stderr; returns stdout text or None on failure"""
+    proc = subprocess.Popen(
+        cmd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        close_fds=True,
+        pass_fds=pass_fds,
+        start_new_session=True,
+    )
+    out, _ = proc.communicate()
+    if proc.returncode != 0:
+        return None
+    return out.decode(errors='replace')
+
+
+def probe_audio_duration(file_path):
     """Get audio file duration in seconds using FFprobe"""
     try:
         cmd = [
@@ -67,71 +307,271 @@ def get_audio_duration(file_path):
             '-of', 'default=noprint_wrappers=1:nokey=1',
             file_path
         ]
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        if result.returncode == 0:
-            duration = float(result.stdout.strip())
+        out = run_ffprobe(cmd)
+        if out is not None:
+            duration = float(out.strip())
             return duration
         return None
     except Exception as e:
-        print(f"Error getting duration: {str(e)}")
+        app.logger.warning("Error getting duration: %s", e)
         return None
 
 
+def get_audio_stream_info(file_path, pass_fds=()):
+    """Get (codec, sample rate, channels) of the first audio stream using FFprobe"""
+    try:
+        cmd = [
+            'ffprobe',
+            '-v', 'error',
+            '-select_streams', 'a:0',
+            '-show_entries', 'stream=codec_name,sample_rate,channels',
+            '-of', 'default=noprint_wrappers=1:nokey=1',
+            file_path
+        ]
+        out = run_ffprobe(cmd, pass_fds=pass_fds)
+        if out is None:
+            return None
+        codec, sample_rate, channels = out.split()
+        return codec, int(sample_rate), int(channels)
+    except Exception as e:
+        app.logger.warning("Error getting stream info: %s", e)
+        return None
+
+
+# Sample rates by MPEG version bits (MPEG 2.5, reserved, MPEG 2, MPEG 1)
+_MP3_SAMPLE_RATES = {
+    0b00: (11025, 12000, 8000),
+    0b10: (22050, 24000, 16000),
+    0b11: (44100, 48000, 32000),
+}
+# Layer III bitrates in kbps by bitrate index, for MPEG 1 and for MPEG 2/2.5
+_MP3_BITRATES_V1 = (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+_MP3_BITRATES_V2 = (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+MP3_HEADER_SCAN_SIZE = 64 * 1024
+
+
+def _parse_mp3_frame_header(data, pos):
+    """Parse an MPEG Layer III frame header at pos; returns (version, sample rate, channels, frame length)"""
+    if pos < 0 or pos + 4 > len(data) or data[pos] != 0xFF:
+        return None
+    b1, b2, b3 = data[pos + 1], data[pos + 2], data[pos + 3]
+    version = (b1 >> 3) & 0b11
+    layer = (b1 >> 1) & 0b11
+    bitrate_index = b2 >> 4
+    sample_rate_index = (b2 >> 2) & 0b11
+    if (b1 & 0xE0 != 0xE0 or version not in _MP3_SAMPLE_RATES or layer != 0b01
+            or bitrate_index in (0, 15) or sample_rate_index == 3):
+        return None
+    sample_rate = _MP3_SAMPLE_RATES[version][sample_rate_index]
+    channels = 1 if b3 >> 6 == 0b11 else 2
+    padding = (b2 >> 1) & 1
+    if version == 0b11:
+        frame_length = 144 * _MP3_BITRATES_V1[bitrate_index] * 1000 // sample_rate + padding
+    else:
+        frame_length = 72 * _MP3_BITRATES_V2[bitrate_index] * 1000 // sample_rate + padding
+    return version, sample_rate, channels, frame_length
+
+
+def read_mp3_stream_info(file_path):
+    """Get ('mp3', sample rate, channels) from the first MPEG Layer III frame header
+
+    Parses the file header in-process so merges don't need an ffprobe per input.
+    A candidate header only counts if another matching header follows it at the
+    computed frame length. Returns None if no such pair is found near the start
+    of the file.
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            data = f.read(10)
+            offset = 0
+            # Skip an ID3v2 tag, whose size is stored as a 28-bit syncsafe integer
+            if len(data) == 10 and data[:3] == b'ID3':
+                size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+                offset = 10 + size + (10 if data[5] & 0x10 else 0)
+            f.seek(offset)
+            data = f.read(MP3_HEADER_SCAN_SIZE)
+    except OSError as e:
+        app.logger.warning("Error reading MP3 header: %s", e)
+        return None
+
+    pos = data.find(b'\xff')
+    while 0 <= pos <= len(data) - 4:
+        header = _parse_mp3_frame_header(data, pos)
+        if header is not None:
+            version, sample_rate, channels, frame_length = header
+            following = _parse_mp3_frame_header(data, pos + frame_length)
+            if following is not None and following[:2] == (version, sample_rate):
+                return 'mp3', sample_rate, channels
+        pos = data.find(b'\xff', pos + 1)
+    return None
+
+
+def get_mp3_stream_info(file_path, pass_fds=()):
+    """Get ('mp3', sample rate, channels) if the file really holds an MP3 stream, else None"""
+    # Fall back to ffprobe only when the header can't be parsed in-process
+    info = read_mp3_stream_info(file_path) or get_audio_stream_info(file_path, pass_fds)
+    if info is None or info[0] != 'mp3':
+        return None
+    return info
+
+
+def can_stream_copy_concat(file_paths, extensions, pass_fds=()):
+    """Check whether files are all MP3 with matching stream parameters"""
+    if not all(ext == 'mp3' for ext in extensions):
+        return False
+    infos = []
+    for path in file_paths:
+        info = get_mp3_stream_info(path, pass_fds)
+        if info is None:
+            return False
+        infos.append(info)
+    return all(info == infos[0] for info in infos[1:])
+
+
+def run_ffmpeg(cmd, pass_fds=()):
+    """Run an ffmpeg command, discarding stdout; returns (returncode, stderr text)"""
+    proc = subprocess.Popen(
+        cmd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        close_fds=True,
+        pass_fds=pass_fds,
+        start_new_session=True,
+    )
+    _, err = proc.communicate()
+    return proc.returncode, err.decode(errors='replace')
+
+
+def write_concat_list(audio_files):
+    """Write an ffmpeg concat list; returns (path, fd) where fd is set for in-memory lists
+
+    On Linux the list lives in a memfd passed to ffmpeg as /proc/self/fd/N, so it
+    never touches disk. Elsewhere it falls back to a file in UPLOAD_FOLDER.
+    """
+    lines = []
+    for audio_file in audio_files:
+        # Use absolute paths to avoid path resolution issues
+        abs_path = os.path.abspath(audio_file)
+        # Escape single quotes in filenames
+        escaped_path = abs_path.replace("'", "'\\''")
+        lines.append(f"file '{escaped_path}'\n")
+    data = "".join(lines).encode()
+
+    if hasattr(os, 'memfd_create') and os.path.isdir('/proc/self/fd'):
+        fd = os.memfd_create("concat")
+        os.write(fd, data)
+        return f"/proc/self/fd/{fd}", fd
+
+    concat_path = os.path.join(UPLOAD_FOLDER, f"concat_{uuid.uuid4()}.txt")
+    with open(concat_path, 'wb') as f:
+        f.write(data)
+    return concat_path, None
+
+
+@functools.lru_cache(maxsize=1)
 def check_ffmpeg():
-    """Check if ffmpeg is installed"""
+    """Check if ffmpeg is installed (cached for the lifetime of the process)"""
     try:
-        subprocess.run(["ffmpeg", "-version"], capture_output=True, check=True)
+        subprocess.run(["ffmpeg", "-version"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
         return True
     except (subprocess.CalledProcessError, FileNotFoundError):
         return False
 
 
+# yt-dlp options shared by every download; outtmpl and hooks are set per download
+YDL_OPTS = {
+    "format": "bestaudio/best",
+    "postprocessors": [
+        {
+            "key": "FFmpegExtractAudio",
+            "preferredcodec": "mp3",
+            "preferredquality": "192",
+        }
+    ],
+    "quiet": False,
+    "no_warnings": False,
+    "socket_timeout": 30,
+    "ignoreerrors": False,
+    "no_color": True,
+    "noplaylist": True,
+}
+
+# One YoutubeDL per download worker thread, reused across downloads
+_ydl_local = local()
+
+
+def get_youtube_dl():
+    """Return this thread's YoutubeDL and its per-download hook slots
+
+    YoutubeDL isn't safe to share between concurrent downloads, so each worker thread
+    keeps its own instance. The extractors, postprocessors and HTTP connection pool
+    are built once per thread instead of once per download.
+    """
+    if not hasattr(_ydl_local, "ydl"):
+        hooks = {"progress": None}
+
+        def dispatch(name):
+            def hook(d):
+                if hooks[name] is not None:
+                    hooks[name](d)
+            return hook
+
+        # yt-dlp keeps the dict it is given as ydl.params, so each instance needs its own copy
+        ydl = YoutubeDL(copy.deepcopy(YDL_OPTS))
+        ydl.add_progress_hook(dispatch("progress"))
+        _ydl_local.ydl = ydl
+        _ydl_local.hooks = hooks
+    return _ydl_local.ydl, _ydl_local.hooks
+
+
 def download_and_convert(url, download_id):
     """Download video and convert to MP3"""
+    # Everything yt-dlp writes for this download (.part, fragments, audio) goes in its own dir
+    download_temp_dir = TEMP_DIR / download_id
     try:
-        downloads_status[download_id] = {
-            "status": "downloading",
-            "progress": 0,
-            "message": "Starting download...",
-        }
-
-        temp_file = TEMP_DIR / f"{download_id}.%(ext)s"
+        download_temp_dir.mkdir(exist_ok=True)
+        temp_file = download_temp_dir / "audio.%(ext)s"
 
         # Define progress hook function first
+        last_percent = -1
+
         def progress_hook(d):
+            nonlocal last_percent
             if d["status"] == "downloading":
-                percent = d.get("_percent_str", "0%").strip().replace("%", "")
-                try:
-                    downloads_status[download_id]["progress"] = float(percent)
-                except:
-                    pass
-                downloads_status[download_id]["message"] = f"Downloading... {d.get('_percent_str', '0%')}"
+                # total_bytes_estimate is a float for fragmented (HLS/DASH) downloads
+                downloaded = int(d.get("downloaded_bytes") or 0)
+                total = int(d.get("total_bytes") or d.get("total_bytes_estimate") or 0)
+                # Estimates can undershoot; 100 is reserved for the completed status
+                percent = min((100 * downloaded) // total, 99) if total else 0
+                # yt-dlp calls this several times a second; only update when the value changes
+                if percent == last_percent:
+                    return
+                last_percent = percent
+                downloads_status[download_id]["progress"] = percent
+                downloads_status[download_id]["message"] = f"Downloading... {percent}%"
             elif d["status"] == "processing":
                 downloads_status[download_id]["message"] = "Processing audio..."
                 downloads_status[download_id]["progress"] = 95
 
-        # Configure yt-dlp
-        ydl_opts = {
-            "format": "bestaudio/best",
-            "postprocessors": [
-                {
-                    "key": "FFmpegExtractAudio",
-                    "preferredcodec": "mp3",
-                    "preferredquality": "192",
-                }
-            ],
-            "outtmpl": str(temp_file),
-            "quiet": False,
-            "no_warnings": False,
-            "progress_hooks": [progress_hook],
-            "socket_timeout": 30,
-            "ignoreerrors": False,
-            "no_color": True,
-            "noplaylist": True,
-        }
+        # Point this thread's yt-dlp instance at the current download
+        ydl, hooks = get_youtube_dl()
+        ydl.params["outtmpl"]["default"] = str(temp_file)
+        hooks["progress"] = progress_hook
+
+        set_download_status(download_id, {
+            "status": "waiting_slot",
+            "progress": 0,
+            "message": "Waiting for a free download slot...",
+        })
 
         try:
-            with YoutubeDL(ydl_opts) as ydl:
+            with host_download_slot(url):
+                set_download_status(download_id, {
+                    "status": "downloading",
+                    "progress": 0,
+                    "message": "Starting download...",
+                })
                 info = ydl.extract_info(url, download=True)
                 title = info.get("title", "audio")
         except AttributeError as ae:
@@ -141,44 +581,56 @@ def download_and_convert(url, download_id):
             raise
 
         # Find the converted MP3 file
-        mp3_file = TEMP_DIR / f"{download_id}.mp3"
+        mp3_file = download_temp_dir / "audio.mp3"
 
         if mp3_file.exists():
             # Move to downloads folder with sanitized name
-            safe_title = "".join(c for c in title if c.isalnum() or c in (" ", "-", "_")).rstrip()
+            safe_title = _TITLE_RE.sub("", title).rstrip()
             output_file = DOWNLOADS_DIR / f"{safe_title}.mp3"
 
             # Handle duplicate filenames
-            counter = 1
-            while output_file.exists():
-                output_file = DOWNLOADS_DIR / f"{safe_title}_{counter}.mp3"
-                counter += 1
+            if output_file.exists():
+                output_file = DOWNLOADS_DIR / f"{safe_title}_{uuid.uuid4().hex[:8]}.mp3"
 
             mp3_file.rename(output_file)
 
-            downloads_status[download_id] = {
+            set_download_status(download_id, {
                 "status": "completed",
                 "progress": 100,
                 "message": "Download complete!",
                 "file": output_file.name,
                 "title": title,
-            }
+            })
         else:
             raise Exception("MP3 file not created")
 
     except Exception as e:
-        downloads_status[download_id] = {
+        set_download_status(download_id, {
             "status": "error",
             "progress": 0,
             "message": str(e),
-        }
+        })
     finally:
+        if hasattr(_ydl_local, "hooks"):
+            _ydl_local.hooks["progress"] = None
+
         # Cleanup temp files
-        for f in TEMP_DIR.glob(f"{download_id}*"):
-            try:
-                f.unlink()
-            except:
-                pass
+        shutil.rmtree(download_temp_dir, ignore_errors=True)
+
+
+# Probe for ffmpeg once at startup so request handlers hit the cache
+check_ffmpeg()
+
+
+def send_audio_file(path, **kwargs):
+    """send_file for already-compressed audio that middleware and proxies must not re-encode"""
+    # conditional responses let the WSGI server hand the file to wsgi.file_wrapper (sendfile)
+    response = send_file(path, conditional=True, etag=True, **kwargs)
+    # MP3 doesn't compress; mark it so gzip middleware (e.g. flask-compress) skips it
+    response.headers['Content-Encoding'] = 'identity'
+    response.cache_control.no_transform = True
+    response.direct_passthrough = True
+    return response
 
 
 # ==================== Routes ====================
@@ -213,16 +665,14 @@ def youtube_download():
         return jsonify({"error": "FFmpeg not installed. Please install FFmpeg to use this service."}), 500
 
     download_id = str(uuid.uuid4())
-    downloads_status[download_id] = {
+    set_download_status(download_id, {
         "status": "queued",
         "progress": 0,
         "message": "Queued for download...",
-    }
+    })
 
-    # Start download in background thread
-    thread = Thread(target=download_and_convert, args=(url, download_id))
-    thread.daemon = True
-    thread.start()
+    # Submit download to the worker pool
+    DOWNLOAD_POOL.submit(download_and_convert, url, download_id)
 
     return jsonify({"download_id": download_id})
 
@@ -230,21 +680,26 @@ def youtube_download():
 @app.route("/api/youtube/status/<download_id>", methods=["GET"])
 def youtube_status(download_id):
     """Get YouTube download status"""
-    if download_id not in downloads_status:
-        return jsonify({"error": "Download not found"}), 404
+    with downloads_status_lock:
+        if download_id not in downloads_status:
+            return jsonify({"error": "Download not found"}), 404
+        status = dict(downloads_status[download_id])
 
-    return jsonify(downloads_status[download_id])
+    return jsonify(status)
 
 
 @app.route("/api/youtube/download/<filename>", methods=["GET"])
 def youtube_download_file(filename):
     """Download the YouTube MP3 file"""
-    file_path = DOWNLOADS_DIR / filename
+    file_path = resolve_in(DOWNLOADS_DIR, filename)
+
+    if file_path is None:
+        return jsonify({"error": "Invalid file path"}), 403
 
     if not file_path.exists():
         return jsonify({"error": "File not found"}), 404
 
-    return send_file(file_path, as_attachment=True)
+    return send_audio_file(file_path, as_attachment=True)
 
 
 # ==================== Clip Routes ====================
@@ -252,6 +707,10 @@ def youtube_download_file(filename):
 @app.route('/api/clip/upload', methods=['POST'])
 def clip_upload_file():
     try:
+        # Reject oversized bodies before Werkzeug parses the upload
+        if (request.content_length or 0) > MAX_FILE_SIZE:
+            return jsonify({'error': 'File too large (max 100MB)'}), 413
+        
         if 'file' not in request.files:
             return jsonify({'error': 'No file provided'}), 400
         
@@ -268,7 +727,7 @@ def clip_upload_file():
         file_extension = file.filename.rsplit('.', 1)[1].lower()
         temp_filename = f"{file_id}.{file_extension}"
         temp_path = os.path.join(UPLOAD_FOLDER, temp_filename)
-        file.save(temp_path)
+        save_upload(file, temp_path)
         
         # Get audio duration
         duration = get_audio_duration(temp_path)
@@ -286,9 +745,7 @@ def clip_upload_file():
         }), 200
     
     except Exception as e:
-        print(f"Error: {str(e)}")
-        import traceback
-        print(traceback.format_exc())
+        app.logger.exception("Clip upload failed")
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
 
@@ -309,35 +766,54 @@ def clip_audio():
             return jsonify({'error': 'Invalid time range'}), 400
         
         # Find the uploaded file
-        input_filename = f"{file_id}.{extension}"
-        input_path = os.path.join(UPLOAD_FOLDER, input_filename)
+        input_path = resolve_in(UPLOAD_DIR, f"{file_id}.{extension}")
         
-        if not os.path.exists(input_path):
+        if input_path is None:
+            return jsonify({'error': 'Invalid file path'}), 403
+        
+        if not input_path.exists():
             return jsonify({'error': 'File not found'}), 404
+        input_path = str(input_path)
         
         # Generate output filename
         output_filename = f"clipped_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp3"
-        output_path = os.path.join(OUTPUT_FOLDER, output_filename)
+        output_path = str(OUTPUT_DIR / output_filename)
         
         # Calculate duration
         duration = end_time - start_time
         
         # Use FFmpeg to clip the audio
-        cmd = [
-            'ffmpeg',
-            '-i', input_path,
-            '-ss', str(start_time),
-            '-t', str(duration),
-            '-c:a', 'libmp3lame',
-            '-b:a', '192k',
-            '-y',
-            output_path
-        ]
+        if extension == 'mp3' and get_mp3_stream_info(input_path) is not None:
+            # Source is already MP3: seek on the input and copy frames without re-encoding
+            cmd = [
+                'ffmpeg',
+                '-hide_banner',
+                '-loglevel', 'error',
+                '-ss', str(start_time),
+                '-i', input_path,
+                '-t', str(duration),
+                '-c', 'copy',
+                '-y',
+                output_path
+            ]
+        else:
+            cmd = [
+                'ffmpeg',
+                '-hide_banner',
+                '-loglevel', 'error',
+                '-i', input_path,
+                '-ss', str(start_time),
+                '-t', str(duration),
+                '-c:a', 'libmp3lame',
+                '-b:a', '192k',
+                '-y',
+                output_path
+            ]
         
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        returncode, stderr = run_ffmpeg(cmd)
         
-        if result.returncode != 0:
-            error_msg = result.stderr if result.stderr else "FFmpeg error"
+        if returncode != 0:
+            error_msg = stderr if stderr else "FFmpeg error"
             return jsonify({'error': f'Clipping failed: {error_msg}'}), 400
         
         return jsonify({
@@ -347,9 +823,7 @@ def clip_audio():
         }), 200
     
     except Exception as e:
-        print(f"Error: {str(e)}")
-        import traceback
-        print(traceback.format_exc())
+        app.logger.exception("Clipping failed")
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
 
@@ -357,14 +831,16 @@ def clip_audio():
 def clip_cleanup_upload(file_id, extension):
     """Clean up uploaded file"""
     try:
-        filename = f"{file_id}.{extension}"
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
+        file_path = resolve_in(UPLOAD_DIR, f"{file_id}.{extension}")
         
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            return jsonify({'success': True}), 200
+        if file_path is None:
+            return jsonify({'error': 'Invalid file path'}), 403
         
-        return jsonify({'error': 'File not found'}), 404
+        try:
+            file_path.unlink()
+        except FileNotFoundError:
+            return jsonify({'error': 'File not found'}), 404
+        return jsonify({'success': True}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -373,7 +849,13 @@ def clip_cleanup_upload(file_id, extension):
 
 @app.route('/api/merge/merge', methods=['POST'])
 def merge_songs():
+    # (path, fd) pairs for uploads saved during this request
+    temp_files = []
     try:
+        # Reject oversized bodies before Werkzeug parses the uploads
+        if (request.content_length or 0) > MAX_FILE_SIZE:
+            return jsonify({'error': 'Files too large (max 100MB total)'}), 413
+        
         # Check if files are in request
         if 'files' not in request.files:
             return jsonify({'error': 'No files provided'}), 400
@@ -385,7 +867,7 @@ def merge_songs():
         
         # Validate files
         audio_files = []
-        temp_files = []
+        extensions = []
         
         for file in files:
             if file.filename == '':
@@ -395,11 +877,10 @@ def merge_songs():
                 return jsonify({'error': f'File {file.filename} has unsupported format'}), 400
             
             # Save temporary file
-            temp_filename = f"{uuid.uuid4()}_{file.filename}"
-            temp_path = os.path.join(UPLOAD_FOLDER, temp_filename)
-            file.save(temp_path)
-            temp_files.append(temp_path)
+            temp_path, temp_fd = save_upload_tmpfile(file)
+            temp_files.append((temp_path, temp_fd))
             audio_files.append(temp_path)
+            extensions.append(file.filename.rsplit('.', 1)[1].lower())
         
         if len(audio_files) < 2:
             return jsonify({'error': 'Please upload at least 2 files'}), 400
@@ -408,49 +889,38 @@ def merge_songs():
         output_filename = f"merged_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp3"
         output_path = os.path.join(OUTPUT_FOLDER, output_filename)
         
-        # Create concat file for ffmpeg
-        concat_filename = f"concat_{uuid.uuid4()}.txt"
-        concat_path = os.path.join(UPLOAD_FOLDER, concat_filename)
+        # Create concat list for ffmpeg
+        concat_path, concat_fd = write_concat_list(audio_files)
+        
+        # Anonymous uploads and the in-memory concat list are handed to ffmpeg by fd
+        pass_fds = tuple(fd for _, fd in temp_files if fd is not None)
         
         try:
-            with open(concat_path, 'w') as f:
-                for audio_file in audio_files:
-                    # Use absolute paths to avoid path resolution issues
-                    abs_path = os.path.abspath(audio_file)
-                    # Escape single quotes in filenames
-                    escaped_path = abs_path.replace("'", "'\\''")
-                    f.write(f"file '{escaped_path}'\n")
-            
-            # Use FFmpeg to merge files
+            # Use FFmpeg to merge files, copying MP3 frames when no re-encode is needed
+            if can_stream_copy_concat(audio_files, extensions, pass_fds):
+                codec_args = ['-c', 'copy']
+            else:
+                codec_args = ['-c:a', 'libmp3lame', '-b:a', '192k']
             cmd = [
                 'ffmpeg',
+                '-hide_banner',
+                '-loglevel', 'error',
                 '-f', 'concat',
                 '-safe', '0',
                 '-i', concat_path,
-                '-c:a', 'libmp3lame',
-                '-b:a', '192k',
+                *codec_args,
                 '-y',
                 output_path
             ]
             
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            if concat_fd is not None:
+                pass_fds += (concat_fd,)
+            returncode, stderr = run_ffmpeg(cmd, pass_fds=pass_fds)
             
-            if result.returncode != 0:
-                error_msg = result.stderr if result.stderr else "FFmpeg error"
+            if returncode != 0:
+                error_msg = stderr if stderr else "FFmpeg error"
                 return jsonify({'error': f'Merge failed: {error_msg}'}), 400
             
-            # Clean up temporary files
-            for temp_file in temp_files:
-                try:
-                    os.remove(temp_file)
-                except:
-                    pass
-            
-            try:
-                os.remove(concat_path)
-            except:
-                pass
-            
             return jsonify({
                 'success': True,
                 'message': 'Files merged successfully',
@@ -459,12 +929,16 @@ def merge_songs():
         
         except Exception as e:
             return jsonify({'error': f'Error merging files: {str(e)}'}), 400
+        finally:
+            release_temp_file(concat_path, concat_fd)
     
     except Exception as e:
-        print(f"Error: {str(e)}")
-        import traceback
-        print(traceback.format_exc())
+        app.logger.exception("Merge failed")
         return jsonify({'error': f'Server error: {str(e)}'}), 500
+    finally:
+        # Clean up temporary files
+        for temp_path, temp_fd in temp_files:
+            release_temp_file(temp_path, temp_fd)
 
 
 # ==================== Common Download Routes ====================
@@ -472,28 +946,24 @@ def merge_songs():
 @app.route('/api/download/<filename>')
 def download_file(filename):
     try:
-        file_path = os.path.join(OUTPUT_FOLDER, filename)
-        abs_file_path = os.path.abspath(file_path)
-        abs_output_folder = os.path.abspath(OUTPUT_FOLDER)
+        file_path = resolve_in(OUTPUT_DIR, filename)
         
         # Security check - ensure file is in output folder
-        if not abs_file_path.startswith(abs_output_folder):
+        if file_path is None:
             return jsonify({'error': 'Invalid file path'}), 403
         
         # Check if file exists
-        if not os.path.exists(abs_file_path):
+        if not file_path.exists():
             return jsonify({'error': 'File not found'}), 404
         
-        return send_file(
-            abs_file_path,
+        return send_audio_file(
+            file_path,
             mimetype='audio/mpeg',
             as_attachment=True,
             download_name=filename
         )
     except Exception as e:
-        print(f"Download error: {str(e)}")
-        import traceback
-        print(traceback.format_exc())
+        app.logger.exception("Download failed")
         return jsonify({'error': str(e)}), 500
 
 
@@ -501,18 +971,22 @@ def download_file(filename):
 def cleanup_output(filename):
     """Clean up output file"""
     try:
-        file_path = os.path.join(OUTPUT_FOLDER, filename)
+        file_path = resolve_in(OUTPUT_DIR, filename)
         
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            return jsonify({'success': True}), 200
+        if file_path is None:
+            return jsonify({'error': 'Invalid file path'}), 403
         
-        return jsonify({'error': 'File not found'}), 404
+        try:
+            file_path.unlink()
+        except FileNotFoundError:
+            return jsonify({'error': 'File not found'}), 404
+        return jsonify({'success': True}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 if __name__ == '__main__':
     # Use port 5001 to avoid conflicts with macOS AirPlay Receiver on port 5000
-    app.run(debug=True, host='127.0.0.1', port=5001)
+    # For production use gunicorn via wsgi.py; set FLASK_DEBUG=1 for the debugger
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1', host='127.0.0.1', port=5001)
 
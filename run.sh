@@ -286,8 +286,13 @@ start_application() {
     print_status "Press Ctrl+C to stop the server"
     echo
     
-    # Start the Flask application
-    python app.py
+    # Start the application under gunicorn when available (not supported on Windows)
+    if command_exists gunicorn; then
+        gunicorn -k gthread -w 1 --threads 16 -b 127.0.0.1:5001 wsgi:app
+    else
+        print_warning "gunicorn not found, falling back to the Flask development server"
+        python app.py
+    fi
 }
 
 # Main execution
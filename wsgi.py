@@ -0,0 +1,8 @@
+"""WSGI entry point for running Songs Formatter under a production server.
+
+    gunicorn -k gthread -w 1 --threads 16 -b 127.0.0.1:5001 wsgi:app
+"""
+from app import app
+
+if __name__ == '__main__':
+    app.run(host='127.0.0.1', port=5001)